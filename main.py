@@ -1,35 +1,70 @@
+import os
+
+# One thread per Tesseract process; we run several processes in parallel
+# instead, which is faster than Tesseract's internal OpenMP threading.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import pytesseract
-from PIL import Image
-import io
-import os
+from PIL import Image, ImageOps
+import numpy as np
+import re
+import asyncio
+import logging
+import hashlib
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
+from diskcache import Cache
 import google.generativeai as genai
 from typing import List
-import json
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from dotenv import load_dotenv
 
+# Prefer the in-process Tesseract API; fall back to the CLI wrapper if
+# tesserocr is not installed
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
-# Set Tesseract path (adjust if needed)
-tesseract_paths = [
+app = FastAPI(default_response_class=ORJSONResponse)
+
+TESSERACT_FALLBACK_PATHS = [
     r"C:\Program Files\Tesseract-OCR\tesseract.exe",
     r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
     "/usr/bin/tesseract",
     "/usr/local/bin/tesseract"
 ]
 
-for path in tesseract_paths:
-    if os.path.exists(path):
-        pytesseract.pytesseract.tesseract_cmd = path
-        break
+if PyTessBaseAPI is not None:
+    # The API is not re-entrant, so each OCR worker thread gets its own
+    # instance; tesserocr finds tessdata via TESSDATA_PREFIX
+    tess_local = threading.local()
+
+# Find Tesseract on PATH, then in common install locations (adjust if needed).
+# Needed even with tesserocr, since thorough-mode deskew runs OSD via pytesseract
+tesseract_cmd = shutil.which("tesseract") or next(
+    (path for path in TESSERACT_FALLBACK_PATHS if os.path.exists(path)), None
+)
+if tesseract_cmd:
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+elif PyTessBaseAPI is None:
+    logger.warning("Tesseract not found on PATH or in common locations. Please install Tesseract OCR.")
 else:
-    print("Warning: Tesseract not found in common locations. Please install Tesseract OCR.")
+    logger.warning("Tesseract binary not found; thorough-mode deskew will be skipped.")
 
 # CORS middleware
 app.add_middleware(
@@ -45,123 +80,88 @@ api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise Exception("GEMINI_API_KEY environment variable not set. Please check your .env file or environment variables.")
 genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
 
-def clean_ocr_text(text):
-    """
-    Clean and preprocess OCR text to improve accuracy
-    """
-    if not text:
-        return text
-    
-    import re
-    
-    # Fix common OCR errors
-    replacements = {
-        'Lable': 'Label',
-        'Chola': 'Chola',
-        '+|bCAmt:+/2¢': 'SubTotal:',
-        'Phn:': 'Phone:',
-        'Qty:': 'Quantity:',
-        'Amt:': 'Amount:',
-        'Cewkehy': 'Company',
-        'Srey': 'Store'
-    }
-    
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    
-    # Clean up excessive whitespace but preserve bill dividers
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
-    
-    # Ensure proper spacing around numbers and currency
-    text = re.sub(r'(\d+)\.(\d+)', r'\1.\2', text)
-    
-    return text.strip()
+# One extracted bill line item
+class BillItem(BaseModel):
+    date: str
+    shop_name: str
+    item_name: str
+    quantity: int
+    unit_price: float
+    total_amount: float
 
-@app.post("/process-images")
-async def process_images(files: List[UploadFile] = File(...)):
-    print(f"Received request with {len(files) if files else 0} files")
-    
-    if not files:
-        raise HTTPException(status_code=400, detail="No files provided")
-    
-    all_text = ""
-    bill_counter = 1
-    
-    for file in files:
-        print(f"Processing file: {file.filename}, type: {file.content_type}")
-        if file.content_type not in ["image/jpeg", "image/png", "application/pdf"]:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
-        
-        contents = await file.read()
-        print(f"File size: {len(contents)} bytes")
-        
-        # Add clear bill header divider
-        all_text += f"\n\n{'='*60}\n"
-        all_text += f"BILL NUMBER {bill_counter} - START\n"
-        all_text += f"{'='*60}\n\n"
-        
-        try:
-            if file.content_type == "application/pdf":
-                print("Converting PDF to images...")
-                # Convert PDF to images
-                images = convert_from_bytes(contents)
-                print(f"PDF has {len(images)} pages")
-                for i, image in enumerate(images):
-                    text = pytesseract.image_to_string(image)
-                    print(f"Page {i+1} text length: {len(text)}")
-                    all_text += text + "\n"
-            else:
-                print("Processing image...")
-                # Process image with enhanced OCR settings
-                image = Image.open(io.BytesIO(contents))
-                
-                # Try multiple OCR configurations for better accuracy
-                custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz .,/-:()+'
-                
-                # First attempt with custom config
-                text1 = pytesseract.image_to_string(image, config=custom_config)
-                
-                # Second attempt with different PSM mode for line detection
-                config2 = r'--oem 3 --psm 4'
-                text2 = pytesseract.image_to_string(image, config=config2)
-                
-                # Third attempt with automatic page segmentation
-                config3 = r'--oem 3 --psm 3'
-                text3 = pytesseract.image_to_string(image, config=config3)
-                
-                # Choose the longest/most complete text
-                texts = [text1, text2, text3]
-                text = max(texts, key=len)
-                
-                print(f"Image text length: {len(text)}")
-                print(f"Extracted text preview: {text[:300]}...")
-                all_text += text + "\n"
-                
-            # Add clear bill footer divider
-            all_text += f"\n{'='*60}\n"
-            all_text += f"BILL NUMBER {bill_counter} - END\n"
-            all_text += f"{'='*60}\n\n"
-            bill_counter += 1
-            
-        except Exception as e:
-            print(f"Error processing file {file.filename}: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error processing file {file.filename}: {str(e)}")
-    
-    print(f"Total extracted text length: {len(all_text)}")
-    if not all_text.strip():
-        raise HTTPException(status_code=400, detail="No text extracted from images")
-    
-    # Clean up the OCR text
-    cleaned_text = clean_ocr_text(all_text)
-    
-    print("Sending to Gemini...")
-    # Send to Gemini
-    print("Cleaned text:")
-    print(cleaned_text)
-    prompt_template = """
+
+BILL_ITEMS = TypeAdapter(list[BillItem])
+
+# Constrain Gemini to JSON matching the schema so the response always parses
+model = genai.GenerativeModel(
+    'gemini-2.5-flash-lite',
+    generation_config={
+        'response_mime_type': 'application/json',
+        'response_schema': list[BillItem],
+    },
+)
+
+# Shared pool for blocking OCR work (Tesseract subprocesses, PDF rasterization)
+OCR_WORKERS = os.cpu_count() or 1
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS)
+
+# Extracted page texts and Gemini results, keyed by content hash. Entries are
+# pickles, so keep them in a private per-user directory rather than shared /tmp
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "bills_ocr",
+)
+os.makedirs(OCR_CACHE_DIR, mode=0o700, exist_ok=True)
+os.chmod(OCR_CACHE_DIR, 0o700)
+ocr_cache = Cache(OCR_CACHE_DIR)
+
+# Cached OCR text expires after a week, Gemini answers after a day
+OCR_CACHE_TTL = 7 * 24 * 60 * 60
+GEMINI_CACHE_TTL = 24 * 60 * 60
+
+# Bill divider pieces
+DIV = "=" * 60
+HEADER = "\n\n" + DIV + "\n"
+
+# 150 DPI is plenty for Tesseract on printed bills
+PDF_DPI = 150
+
+# Tesseract gains nothing from pages larger than this (roughly 300 DPI)
+MAX_IMAGE_SIDE = 2000
+
+# Uploads are copied in 64 KiB chunks and kept in memory up to 10 MB
+UPLOAD_CHUNK_SIZE = 1 << 16
+SPOOL_MAX_MEMORY = 10_000_000
+
+# Per-file upload limit
+MAX_BYTES = 15 * 1024 * 1024
+
+# Leading bytes of each supported file type
+MAGIC_TYPES = {
+    b"%PDF": "application/pdf",
+    b"\x89PNG": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+}
+
+# Page segmentation modes: 6 = single block, 4 = single column, 3 = automatic
+OCR_PSMS = [6]
+OCR_PSMS_THOROUGH = OCR_PSMS + [4, 3]
+# Maximum number of images per Tesseract list file
+OCR_BATCH_SIZE = 50
+
+# Bump when preprocessing or OCR output changes so stale cached text is not
+# served; the engine and tunables above are part of the key as well
+OCR_CACHE_VERSION = 1
+OCR_CACHE_TAG = "v{}:{}:dpi{}:max{}:psm{}".format(
+    OCR_CACHE_VERSION,
+    "tesserocr" if PyTessBaseAPI is not None else "pytesseract",
+    PDF_DPI,
+    MAX_IMAGE_SIDE,
+    ",".join(map(str, OCR_PSMS_THOROUGH)),
+)
+
+PROMPT_TEMPLATE = """
 You are an intelligent document processor that extracts bill/invoice data from OCR text into a unified table.
 
 The text contains MULTIPLE DIFFERENT BILLS/INVOICES separated by clear dividers.
@@ -237,30 +237,382 @@ Text to process:
 __ALL_TEXT_PLACEHOLDER__
 """
 
-    prompt = prompt_template.replace("__ALL_TEXT_PLACEHOLDER__", cleaned_text)
+# Split once at the placeholder so each request is a single concatenation
+PROMPT_PREFIX, PROMPT_SUFFIX = PROMPT_TEMPLATE.split("__ALL_TEXT_PLACEHOLDER__", 1)
+
+# Common OCR errors and their fixes
+_REPLACEMENTS = {
+    'Lable': 'Label',
+    'Chola': 'Chola',
+    '+|bCAmt:+/2¢': 'SubTotal:',
+    'Phn:': 'Phone:',
+    'Qty:': 'Quantity:',
+    'Amt:': 'Amount:',
+    'Cewkehy': 'Company',
+    'Srey': 'Store'
+}
+# Longest first so e.g. '+|bCAmt:+/2¢' wins over 'Amt:'
+_REPL_RE = re.compile('|'.join(map(re.escape, sorted(_REPLACEMENTS, key=len, reverse=True))))
+_WS_RE = re.compile(r'[ \t]+')
+_BLANK_RE = re.compile(r'\n\s*\n\s*\n')
+
+def clean_ocr_text(text):
+    """
+    Clean and preprocess OCR text to improve accuracy
+    """
+    if not text:
+        return text
+    
+    # Fix common OCR errors in a single pass
+    text = _REPL_RE.sub(lambda m: _REPLACEMENTS[m.group(0)], text)
+    
+    # Clean up excessive whitespace but preserve bill dividers
+    text = _WS_RE.sub(' ', text)
+    text = _BLANK_RE.sub('\n\n', text)
+    
+    return text.strip()
+
+def _sniff_type(head):
+    """
+    Identify a supported file type from its leading magic bytes
+    """
+    for magic, content_type in MAGIC_TYPES.items():
+        if head.startswith(magic):
+            return content_type
+    return None
+
+async def _spool_upload(file):
+    """
+    Copy an upload into a temporary file in bounded chunks
+    """
+    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    # The client-supplied content type can't be trusted, so sniff the header
+    content_type = _sniff_type(chunk)
+    if content_type is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+    
+    if content_type == "application/pdf":
+        # poppler needs a real path to read from
+        spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    try:
+        while chunk:
+            size += len(chunk)
+            if size > MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"File too large: {file.filename}")
+            spool.write(chunk)
+            digest.update(chunk)
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        _discard_spool(spool, content_type)
+        raise
+    spool.seek(0)
+    return spool, content_type, size, digest.hexdigest()
+
+def _discard_spool(spool, content_type):
+    """
+    Close a spooled upload and remove its file from disk if it has one
+    """
+    spool.close()
+    if content_type == "application/pdf":
+        os.remove(spool.name)
+
+def _decode_image(fp):
+    """
+    Fully decode an image file into memory
+    """
+    image = Image.open(fp)
+    image.load()
+    return image
+
+async def _load_pages(filename, spool, content_type):
+    """
+    Decode an uploaded file into a list of page images
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        if content_type == "application/pdf":
+            logger.debug("Converting PDF to images...")
+            spool.close()
+            # Convert PDF to images, splitting pages across poppler processes
+            images = await loop.run_in_executor(ocr_executor, partial(
+                convert_from_path, spool.name, dpi=PDF_DPI, thread_count=OCR_WORKERS,
+                fmt="jpeg", use_pdftocairo=True,
+            ))
+            logger.debug("PDF has %d pages", len(images))
+            return images
+        else:
+            logger.debug("Processing image...")
+            image = await loop.run_in_executor(ocr_executor, _decode_image, spool)
+            return [image]
+    except Exception as e:
+        logger.error("Error processing file %s: %s", filename, e)
+        raise HTTPException(status_code=500, detail=f"Error processing file {filename}: {str(e)}")
+    finally:
+        _discard_spool(spool, content_type)
+
+def _otsu_threshold(arr):
+    """
+    Pick the grey level that best separates ink from paper (Otsu's method)
+    """
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * levels)
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    return int(np.argmax(weight_bg * weight_fg * (mean_bg - mean_fg) ** 2))
+
+def _preprocess(image, deskew=False):
+    """
+    Downscale, grayscale and binarize a page so Tesseract has less to do
+    """
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+    # Flatten transparency onto white; transparent pixels are often stored as
+    # black and would otherwise turn the whole page black
+    if "A" in image.getbands() or "transparency" in image.info:
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image.convert("RGBA"))
+    image = ImageOps.autocontrast(image.convert("L"))
+    
+    if deskew:
+        # Orientation detection is an extra Tesseract run, so only do it on request
+        try:
+            osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+            if osd["rotate"]:
+                image = image.rotate(-osd["rotate"], expand=True, fillcolor=255)
+        except Exception as e:
+            logger.debug("Skipping deskew: %s", e)
+    
+    arr = np.asarray(image)
+    return Image.fromarray((arr > _otsu_threshold(arr)).astype(np.uint8) * 255)
+
+def _ocr_image(image, psm):
+    """
+    OCR a single image with this worker thread's in-process Tesseract API
+    """
+    api = getattr(tess_local, "api", None)
+    if api is None:
+        api = tess_local.api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+    api.SetPageSegMode(psm)
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+def _ocr_batch(paths, list_path, psm):
+    """
+    OCR several images with one Tesseract process via an image list file
+    """
+    with open(list_path, "w") as f:
+        f.write("\n".join(paths) + "\n")
+    text = pytesseract.image_to_string(list_path, config=f"--oem 3 --psm {psm}")
+    # Tesseract ends every page with a form feed; if it skipped an entry the
+    # remaining pages can't be matched back to their bills
+    pages = text.split("\x0c")
+    if len(pages) < len(paths):
+        raise RuntimeError(f"Tesseract returned {len(pages)} pages for {len(paths)} images")
+    return pages[:len(paths)]
+
+async def _ocr_pages(images, thorough=False):
+    """
+    OCR all page images, batching them into as few Tesseract runs as possible
+    """
+    if not images:
+        return []
+    
+    loop = asyncio.get_running_loop()
+    # A single block pass is usually enough since Gemini fixes residual
+    # OCR errors; thorough mode also tries line detection and
+    # automatic page segmentation
+    psms = OCR_PSMS_THOROUGH if thorough else OCR_PSMS
+    
+    images = await asyncio.gather(*[
+        loop.run_in_executor(ocr_executor, _preprocess, image, thorough)
+        for image in images
+    ])
+    
+    if PyTessBaseAPI is not None:
+        results = await asyncio.gather(*[
+            asyncio.gather(*[
+                loop.run_in_executor(ocr_executor, _ocr_image, image, psm)
+                for image in images
+            ])
+            for psm in psms
+        ])
+        # Choose the longest/most complete text for each page
+        return [max(texts, key=len) for texts in zip(*results)]
+    
+    with tempfile.TemporaryDirectory(prefix="bills_ocr_") as tmpdir:
+        # Encode each page once and reuse the file for every PSM pass; these are
+        # scratch files, so favour encode speed over size
+        paths = [os.path.join(tmpdir, f"page_{i}.png") for i in range(len(images))]
+        await asyncio.gather(*[
+            loop.run_in_executor(ocr_executor, partial(image.save, path, format="PNG", compress_level=1))
+            for image, path in zip(images, paths)
+        ])
+        
+        # Spread pages evenly over the OCR workers; large batches can hang
+        # Tesseract on a full pipe, so cap each list file as well
+        batch_size = min(OCR_BATCH_SIZE, -(-len(paths) // OCR_WORKERS))
+        chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        jobs = [
+            loop.run_in_executor(
+                ocr_executor, _ocr_batch, chunk,
+                os.path.join(tmpdir, f"list_{c}_{i}.txt"), psm,
+            )
+            for c, psm in enumerate(psms)
+            for i, chunk in enumerate(chunks)
+        ]
+        results = await asyncio.gather(*jobs)
+    
+    # Regroup chunk results into one list of page texts per mode
+    per_psm = [
+        [text for chunk_texts in results[c * len(chunks):(c + 1) * len(chunks)] for text in chunk_texts]
+        for c in range(len(psms))
+    ]
+    # Choose the longest/most complete text for each page
+    return [max(texts, key=len) for texts in zip(*per_psm)]
+
+def _cache_get(key):
+    """
+    Look up a cache entry, treating any cache failure as a miss
+    """
+    try:
+        return ocr_cache.get(key)
+    except Exception as e:
+        logger.warning("Cache lookup failed for %s: %s", key, e)
+        return None
+
+def _cache_set(key, value, expire=None):
+    """
+    Store a cache entry; the cache is best-effort, so failures are only logged
+    """
+    try:
+        ocr_cache.set(key, value, expire=expire)
+    except Exception as e:
+        logger.warning("Cache write failed for %s: %s", key, e)
+
+def _cache_ocr_texts(entries):
+    """
+    Store freshly extracted page texts in the OCR cache
+    """
+    for key, texts in entries:
+        _cache_set(key, texts, expire=OCR_CACHE_TTL)
 
+@app.post("/process-images")
+async def process_images(files: List[UploadFile] = File(...), thorough: bool = False, refresh: bool = False):
+    logger.info("Received request with %d files", len(files) if files else 0)
+    
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    
+    # Reject oversized uploads before reading anything
+    for file in files:
+        if file.size and file.size > MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File too large: {file.filename}")
+    
+    loop = asyncio.get_running_loop()
+    
+    # Page texts per bill, filled from the OCR cache where possible
+    bill_texts = []
+    cache_keys = []
+    uploads = []
+    try:
+        for file in files:
+            spool, content_type, size, digest = await _spool_upload(file)
+            # Track the spool right away so it is cleaned up if anything below fails
+            uploads.append((file.filename, spool, content_type))
+            logger.debug("Processing file: %s, type: %s, size: %d bytes", file.filename, content_type, size)
+            
+            cache_key = f"ocr:{OCR_CACHE_TAG}:{digest}:{int(thorough)}"
+            # diskcache does SQLite and file I/O, so keep it off the event loop
+            texts = await loop.run_in_executor(None, _cache_get, cache_key)
+            if texts is not None:
+                logger.debug("Using cached OCR text for %s", file.filename)
+                uploads.pop()
+                _discard_spool(spool, content_type)
+            bill_texts.append(texts)
+            cache_keys.append(cache_key)
+    except BaseException:
+        for _, spool, content_type in uploads:
+            _discard_spool(spool, content_type)
+        raise
+    missing = [i for i, texts in enumerate(bill_texts) if texts is None]
+    
+    # Decode all files concurrently; results come back in upload order
+    bills = await asyncio.gather(*[_load_pages(*upload) for upload in uploads])
+    
+    # OCR every page of every bill in one batch
+    pages = [image for images in bills for image in images]
     try:
-        response = model.generate_content(prompt)
-        raw_text = response.text.strip()
-        print(f"Gemini response length: {len(raw_text)}")
-        print(f"Gemini response preview: {raw_text[:200]}...")
+        page_texts = await _ocr_pages(pages, thorough=thorough)
+    except Exception as e:
+        logger.error("Error running OCR: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error running OCR: {str(e)}")
+    
+    offset = 0
+    for i, images in zip(missing, bills):
+        bill_texts[i] = page_texts[offset:offset + len(images)]
+        offset += len(images)
+    if missing:
+        await loop.run_in_executor(None, _cache_ocr_texts, [(cache_keys[i], bill_texts[i]) for i in missing])
+    
+    parts = []
+    for bill_counter, texts in enumerate(bill_texts, start=1):
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, text in enumerate(texts):
+                logger.debug("Bill %d page %d text length: %d", bill_counter, i + 1, len(text))
+        
+        # Add clear bill header divider
+        parts.extend([HEADER, f"BILL NUMBER {bill_counter} - START\n", DIV, "\n\n"])
         
-        # Clean the response - remove any markdown code blocks
-        if raw_text.startswith("```json"):
-            raw_text = raw_text[7:]
-        if raw_text.endswith("```"):
-            raw_text = raw_text[:-3]
-        raw_text = raw_text.strip()
+        for text in texts:
+            parts.extend([text, "\n"])
+        
+        # Add clear bill footer divider
+        parts.extend(["\n", DIV, f"\nBILL NUMBER {bill_counter} - END\n", DIV, "\n\n"])
+    
+    all_text = "".join(parts)
+    logger.debug("Total extracted text length: %d", len(all_text))
+    if not all_text.strip():
+        raise HTTPException(status_code=400, detail="No text extracted from images")
+    
+    # Clean up the OCR text
+    cleaned_text = clean_ocr_text(all_text)
+    
+    # Send to Gemini
+    logger.debug("Sending to Gemini, cleaned text:\n%s", cleaned_text)
+    prompt = PROMPT_PREFIX + cleaned_text + PROMPT_SUFFIX
+    
+    # Skip Gemini on a repeat prompt, unless the caller asks for a fresh answer
+    # (e.g. retrying after a wrong extraction)
+    gemini_key = "gemini:" + hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+    structured_data = None if refresh else await loop.run_in_executor(None, _cache_get, gemini_key)
+    if structured_data is not None:
+        logger.debug("Using cached Gemini response")
+        return ORJSONResponse({"data": structured_data})
+
+    try:
+        # Await the async client so other requests keep running meanwhile
+        response = await model.generate_content_async(prompt)
+        raw_text = response.text
+        logger.debug("Gemini response length: %d", len(raw_text))
+        logger.debug("Gemini response preview: %.200s...", raw_text)
         
-        structured_data = json.loads(raw_text)
-        print("Successfully parsed JSON from Gemini")
-        return {"data": structured_data}
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {str(e)}")
-        print(f"Raw text: {raw_text}")
+        # Plain dicts cache cleanly and go straight to orjson, skipping
+        # FastAPI's jsonable_encoder pass
+        structured_data = BILL_ITEMS.dump_python(BILL_ITEMS.validate_json(raw_text))
+        logger.debug("Successfully parsed JSON from Gemini")
+        await loop.run_in_executor(None, partial(_cache_set, gemini_key, structured_data, expire=GEMINI_CACHE_TTL))
+        return ORJSONResponse({"data": structured_data})
+    except ValidationError as e:
+        logger.error("JSON validation error: %s", e)
+        logger.debug("Raw text: %s", raw_text)
         raise HTTPException(status_code=500, detail=f"Invalid JSON from Gemini: {raw_text[:200]}... Error: {str(e)}")
     except Exception as e:
-        print(f"Gemini error: {str(e)}")
+        logger.error("Gemini error: %s", e)
         raise HTTPException(status_code=500, detail=f"Error processing with Gemini: {str(e)}")
 
 @app.get("/")